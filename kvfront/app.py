@@ -1,11 +1,31 @@
-import os, time, asyncio, hashlib                               #calcolo hash (md5) per distribuire le chiavi sui backend.
-from typing import Any, Dict, List, Tuple, Optional
+import os, time, json, asyncio, hashlib                         #calcolo hash (md5) per distribuire le chiavi sui backend.
+from collections import deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Tuple, Optional
 
 import httpx
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
 
-app = FastAPI(title="KV Front (Coordinator)")                   #crea l'app fastapi del kvfront
+try:
+    import orjson                                                   #encode/decode JSON in C (risposte ai client e richieste ai backend)
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+    _loads = orjson.loads
+except ImportError:                                                 #senza orjson si resta sul json della stdlib
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+    _loads = json.loads
+_JSON_HDR = {"content-type": "application/json"}
+
+class FastJSONResponse(JSONResponse):
+    """Risposta JSON serializzata con _dumps (orjson se presente) invece del json della stdlib."""
+    def render(self, content: Any) -> bytes:
+        return _dumps(content)
+
+app = FastAPI(title="KV Front (Coordinator)",                   #crea l'app fastapi del kvfront
+              default_response_class=FastJSONResponse)
 
 
 # Config da env
@@ -15,6 +35,10 @@ BACKENDS = [x.strip() for x in os.getenv("BACKENDS","http://kvstore:9000").split
 RF       = int(os.getenv("RF", "2"))                                            # fattore di replica (Rf=2)
 READ_REPAIR = os.getenv("READ_REPAIR","1") == "1"                               # Flag per read-repair
 HINT_FLUSH_SEC = int(os.getenv("HINT_FLUSH_SEC","2"))                           # C3: frequenza flush hint. Ogni quanti secondi provare a rispedire gli hint
+HINT_FLUSH_PAR = int(os.getenv("HINT_FLUSH_PAR","32"))                          # PUT di hint in parallelo al massimo verso un singolo backend
+HINT_MAX       = int(os.getenv("HINT_MAX","10000"))                             # hint tenuti al massimo per backend: oltre si scartano i più vecchi
+BACKEND_MAX_CONNECTIONS = int(os.getenv("BACKEND_MAX_CONNECTIONS", "200"))      # tetto alle connessioni simultanee verso i kvstore
+BACKEND_MAX_KEEPALIVE   = int(os.getenv("BACKEND_MAX_KEEPALIVE", "100"))        # connessioni keep-alive tenute aperte verso i kvstore
 
 if RF > len(BACKENDS):                                         #se RF maggiore del numero di backend reali, scala RF al massimo possibile  
     RF = len(BACKENDS)
@@ -56,14 +80,124 @@ class CasModel(BaseModel):
     old: Any
     new: Any
 
+class IdemClaimModel(BaseModel):
+    """
+    Modello Pydantic per la prenotazione di una Idempotency-Key.
+
+    Rappresenta il corpo JSON atteso dall’API `POST /kv/idem_claim`.
+
+    Attributi:
+        key (str):
+            La chiave di idempotenza (es. "idem:<Idempotency-Key>").
+        tentative_id (str):
+            L'ID da associare alla chiave se non è ancora stata usata.
+        delivery_key_prefix (str):
+            Prefisso della chiave del documento da restituire per l'ID vincente.
+    """
+    key: str
+    tentative_id: str
+    delivery_key_prefix: str = "delivery:"
+
+class PatchCasModel(BaseModel):
+    """
+    Modello Pydantic per CAS "a patch" su documenti dict.
+
+    Rappresenta il corpo JSON atteso dall'API `POST /kv/patch_cas`.
+    Invece dell'intero documento vecchio/nuovo il client invia solo i campi
+    da verificare e quelli da modificare.
+
+    Attributi:
+        key (str):
+            La chiave su cui effettuare la CAS (es. "drone:drone-1").
+        if_equals (Dict[str, Any]) [JSON "if"]:
+            Campi che devono valere esattamente questi valori.
+        if_min (Dict[str, float]) [JSON "min"]:
+            Campi numerici che devono essere >= di questi valori.
+        set_to (Dict[str, Any]) [JSON "set"]:
+            Campi da scrivere se la condizione è verificata.
+        unset (List[str]):
+            Campi da rimuovere se la condizione è verificata.
+    """
+    key: str
+    if_equals: Dict[str, Any] = Field(default_factory=dict, alias="if")
+    if_min: Dict[str, float] = Field(default_factory=dict, alias="min")
+    set_to: Dict[str, Any] = Field(default_factory=dict, alias="set")
+    unset: List[str] = Field(default_factory=list)
+
+class TxnModel(BaseModel):
+    """
+    Modello Pydantic per una sequenza di CAS a patch su chiavi diverse.
+
+    Rappresenta il corpo JSON atteso dall'API `POST /kv/txn`.
+
+    Attributi:
+        ops (List[PatchCasModel]):
+            Le patch da applicare, nell'ordine: o tutte o nessuna.
+    """
+    ops: List[PatchCasModel]
+
+class McasModel(BaseModel):
+    """
+    Modello Pydantic per più CAS indipendenti in un'unica richiesta.
+
+    Rappresenta il corpo JSON atteso dall’API `POST /kv/mcas`.
+
+    Attributi:
+        ops (List[CasModel]):
+            Le CAS da eseguire; ognuna riesce o fallisce per conto suo.
+    """
+    ops: List[CasModel]
+
+class MpatchModel(BaseModel):
+    """
+    Modello Pydantic per più CAS a patch indipendenti in un'unica richiesta.
+
+    Rappresenta il corpo JSON atteso dall’API `POST /kv/mpatch`.
+
+    Attributi:
+        ops (List[PatchCasModel]):
+            Le patch da applicare; ognuna riesce o fallisce per conto suo.
+    """
+    ops: List[PatchCasModel]
+
+class MputModel(BaseModel):
+    """
+    Modello Pydantic per scritture multiple.
+
+    Rappresenta il corpo JSON atteso dall’API `POST /kv/mput`.
+
+    Attributi:
+        values (Dict[str, Any]):
+            Mappa chiave logica -> valore da scrivere in un'unica richiesta.
+    """
+    values: Dict[str, Any]
+
+class MgetModel(BaseModel):
+    """
+    Modello Pydantic per letture multiple.
+
+    Rappresenta il corpo JSON atteso dall’API `POST /kv/mget`.
+
+    Attributi:
+        keys (List[str]):
+            Le chiavi logiche da leggere in un'unica richiesta.
+        versions (Optional[Dict[str, float]]):
+            Versione (timestamp LWW) già nota al client per alcune chiavi:
+            quelle non cambiate non vengono rispedite.
+    """
+    keys: List[str]
+    versions: Optional[Dict[str, float]] = None
+
 # Util: hashing e anello
 def _h(s: str) -> int:
     """
     Calcola l'hash di una stringa restituendo un intero.
 
-    La funzione usa MD5 per ottenere un digest esadecimale e lo converte in 
-    un intero base 16. Serve a trasformare una chiave arbitraria in un numero 
-    deterministico da usare per il consistent hashing.
+    La funzione usa MD5 e interpreta direttamente i byte del digest come intero
+    (stesso valore di int(hexdigest, 16), senza passare per la stringa esadecimale).
+    Serve a trasformare una chiave arbitraria in un numero deterministico da usare
+    per il consistent hashing: cambiare funzione di hash sposterebbe le chiavi già
+    salvate sui volumi dei kvstore.
 
     Args:
         s (str): La stringa di input (tipicamente una chiave KV, es. "delivery:123").
@@ -71,9 +205,10 @@ def _h(s: str) -> int:
     Returns:
         int: Valore intero derivato dall'hash MD5 della stringa.
     """
-    return int(hashlib.md5(s.encode("utf-8")).hexdigest(), 16)              #converte la stringa in ingresso in byte, calcola l’hash MD5 e lo restituisce 
-                                                                            #in esadecimale. Converte la stringa esadecimale in un intero base 16
-def replica_set(key: str) -> List[str]:
+    return int.from_bytes(hashlib.md5(s.encode("utf-8")).digest(), "big")   #converte la stringa in ingresso in byte, calcola l’hash MD5 
+                                                                            #e legge i 16 byte del digest come intero big-endian
+@lru_cache(maxsize=8192)                                                    #le stesse chiavi tornano di continuo: niente hash ripetuti
+def replica_set(key: str) -> Tuple[str, ...]:
     """
     Determina l'insieme di backend (repliche) da usare per una chiave.
 
@@ -85,19 +220,19 @@ def replica_set(key: str) -> List[str]:
         key (str): La chiave da replicare (es. "delivery:123").
 
     Returns:
-        List[str]: Lista ordinata di URL dei backend da usare.
+        Tuple[str, ...]: Tupla ordinata (immutabile: il risultato è in cache) di URL dei backend da usare.
                    - Il primo è il primario.
                    - I successivi sono le repliche.
-                   - Lista vuota se non ci sono backend configurati.
+                   - Vuota se non ci sono backend configurati.
     """
 
     if not BACKENDS:
-        return []
+        return ()
     start = _h(key) % len(BACKENDS)                                     #usa l’hash della chiave modulo len(BACKENDS), per scegliere l’indice di partenza 
     out = []                                                            #nella lista dei BACKENDS da cui partire
     for i in range(RF):
         out.append(BACKENDS[(start + i) % len(BACKENDS)])               #costruisce la lista dei backend su cui scrivere/leggere quella chiave.
-    return out
+    return tuple(out)
 
 
 # LWW: wrapper con timestamp
@@ -149,9 +284,32 @@ def unwrap(stored: Any) -> Tuple[float, Any]:
 
                                                                                     #cosi che perde con qualsiasi confronto per LWW
 # Hinted handoff
-# mappa: backend_url -> lista di (key, wrapped_value)
-_HINTS: Dict[str, List[Tuple[str, Dict[str, Any]]]] = {} #buffer in memoria (dict) che raccoglie le scritture non riuscite verso certe repliche.
-#chiave: URL del backend in errore, valore: lista di tuple (key, wrapped_value) da ritentare più tardi.
+# mappa: backend_url -> coda limitata di (key, wrapped_value)
+_BACKEND_MGET_OK = True     #diventa False se un backend non espone POST /kv/mget (si torna alle GET per chiave)
+
+_HINTS: Dict[str, Deque[Tuple[str, Dict[str, Any]]]] = {} #buffer in memoria (dict) che raccoglie le scritture non riuscite verso certe repliche.
+#chiave: URL del backend in errore, valore: deque(maxlen=HINT_MAX) di tuple (key, wrapped_value) da ritentare più tardi.
+_HINT_DROPS: Dict[str, int] = {}    #hint scartati per backend perché la coda era piena (la replica resta indietro fino al read-repair)
+
+def add_hints(b: str, items) -> None:
+    """
+    Accoda degli hint per il backend b, senza superare HINT_MAX: durante un guasto lungo
+    la memoria resta limitata e si perdono gli hint più vecchi (contati in _HINT_DROPS).
+
+    Args:
+        b (str): URL del backend a cui sono destinati.
+        items: Iterabile di tuple (key, wrapped_value), dal più vecchio.
+
+    Returns:
+        None
+    """
+    q = _HINTS.get(b)
+    if q is None:
+        q = _HINTS[b] = deque(maxlen=HINT_MAX)
+    for it in items:
+        if len(q) == HINT_MAX:
+            _HINT_DROPS[b] = _HINT_DROPS.get(b, 0) + 1
+        q.append(it)    #a coda piena la deque butta da sola il più vecchio
 async def flush_hints():
     """
     Loop periodico che tenta di consegnare gli "hint" (scritture non riuscite)
@@ -159,8 +317,10 @@ async def flush_hints():
 
     Funzionamento:
         - Ogni HINT_FLUSH_SEC secondi itera sulla mappa globale _HINTS.
-        - Per ciascun backend, prova a reinviare tutti i (key, wrapped_value).
-        - Se la PUT fallisce (HTTP != 200 o eccezione), l'item resta nel buffer.
+        - Per ciascun backend, prova a reinviare i (key, wrapped_value): per ogni chiave solo
+          il più recente, con al più HINT_FLUSH_PAR PUT in parallelo.
+        - Se la PUT fallisce (HTTP != 200 o eccezione), l'item torna nel buffer, davanti
+          agli hint arrivati nel frattempo (sempre entro HINT_MAX).
         - Se tutti gli item di un backend vanno a buon fine, il backend viene
           rimosso da _HINTS.
     """
@@ -169,23 +329,24 @@ async def flush_hints():
         try:
             if not _HINTS:  #se non ci sono riscritture da fare salta 
                 continue
-            async with httpx.AsyncClient(timeout=2.0) as c: #crea un client http
-                to_del = []
-                for b, items in list(_HINTS.items()): #per ogni backends nel dizionario _HINTS
-                    still: List[Tuple[str, Dict[str, Any]]] = []  #lista che raccoglierà gli elementi che ancora non riesce a scrivere 
-                    for k, val in items:  #per ogni key e valore nella lista hint di quel backend prova il put sul quel backend
-                        try:
-                            r = await c.put(f"{b}/kv/{k}", json={"value": val})
-                            if r.status_code != 200:
-                                still.append((k, val)) #se non riesce la tupla finisce in still
-                        except Exception:
-                            still.append((k, val))
-                    if still:
-                        _HINTS[b] = still #se still non è vuoto aggiorna _hints con le tuple da riprovare al ciclo dopo
-                    else:
-                        to_del.append(b) #altrimenti segna la lista di tuple associata a b in modo da cancellarla dal buffer
-                for b in to_del:
-                    _HINTS.pop(b, None) #rimuove quindi la chiave dal buffer perchè non ci sono riscritture da dover fare 
+            c = backend_client()
+            for b in list(_HINTS): #per ogni backends nel dizionario _HINTS
+                items = _HINTS.pop(b, ())  #prende gli hint di quel backend (quelli che arrivano durante il flush finiscono in una coda nuova)
+                latest: Dict[str, Dict[str, Any]] = {}  #per ogni chiave basta l'hint più recente (LWW): niente PUT vecchie in parallelo a quelle nuove
+                for k, val in items:
+                    if k not in latest or unwrap(val)[0] >= unwrap(latest[k])[0]:
+                        latest[k] = val
+                sem = asyncio.Semaphore(HINT_FLUSH_PAR)  #non sommerge un backend che si sta riprendendo
+                async def put(k: str, val: Dict[str, Any]):
+                    async with sem:
+                        return await c.put(f"{b}/kv/{k}", content=_dumps({"value": val}), headers=_JSON_HDR)
+                results = await asyncio.gather(*[put(k, val) for k, val in latest.items()], return_exceptions=True)  #PUT in parallelo
+                still = [(k, val) for (k, val), r in zip(latest.items(), results)
+                         if isinstance(r, Exception) or r.status_code != 200]  #lista degli elementi che ancora non riesce a scrivere 
+                if still:
+                    newer = _HINTS.pop(b, ())
+                    add_hints(b, still)  #da riprovare al ciclo dopo, prima degli hint arrivati nel frattempo
+                    add_hints(b, newer)
         except Exception:
             # best-effort: non fermare il front
             pass
@@ -195,9 +356,9 @@ async def _start():
     """
     Evento di avvio dell'app FastAPI.
 
-    Avvia in background il task asincrono di "flush_hints" che,
-    per tutta la vita del processo, proverà periodicamente a svuotare
-    il buffer degli hint (_HINTS).
+    Crea il client HTTP condiviso verso i backend e avvia in background
+    il task asincrono di "flush_hints" che, per tutta la vita del processo,
+    proverà periodicamente a svuotare il buffer degli hint (_HINTS).
 
     Args:
         None
@@ -205,12 +366,44 @@ async def _start():
     Returns:
         None
     """
+    backend_client()
     # avvia il flusher di hint
     asyncio.create_task(flush_hints())
 
+@app.on_event("shutdown")
+async def _stop():
+    """
+    Evento di spegnimento dell'app FastAPI: chiude il client HTTP condiviso verso i backend.
+
+    Returns:
+        None
+    """
+    global _HTTP
+    if _HTTP is not None:
+        await _HTTP.aclose()
+        _HTTP = None
+
 # =======================
 # HTTP helpers
 # =======================
+_HTTP: Optional[httpx.AsyncClient] = None                                       #client unico verso i backend (creato allo startup)
+
+def backend_client() -> httpx.AsyncClient:
+    """
+    Restituisce il client HTTP condiviso verso i kvstore, creandolo al primo uso.
+
+    Un solo pool keep-alive per tutto il processo: le richieste ai backend riusano
+    le connessioni invece di aprirne di nuove a ogni chiamata.
+
+    Returns:
+        httpx.AsyncClient: client con timeout 2 s e pool dimensionato da BACKEND_MAX_*.
+    """
+    global _HTTP
+    if _HTTP is None:
+        _HTTP = httpx.AsyncClient(timeout=2.0, limits=httpx.Limits(
+            max_connections=BACKEND_MAX_CONNECTIONS, max_keepalive_connections=BACKEND_MAX_KEEPALIVE))
+    return _HTTP
+
 async def get_one(client: httpx.AsyncClient, base: str, key: str) -> Optional[Any]:
     """
     Recupera il valore di una chiave da un singolo backend KV.
@@ -239,7 +432,7 @@ async def get_one(client: httpx.AsyncClient, base: str, key: str) -> Optional[An
         if r.status_code == 404:
             return None
         r.raise_for_status()
-        return r.json()["value"]
+        return _loads(r.content)["value"]
     except Exception:
         return None
 
@@ -267,13 +460,37 @@ async def put_one(client: httpx.AsyncClient, base: str, key: str, val: Any) -> b
             - `False` in caso di errore HTTP o eccezione di rete.
     """
     try:
-        r = await client.put(f"{base}/kv/{key}", json={"value": val}) #fa una richiesta HTTP PUT al backend specificato nell'URL
+        r = await client.put(f"{base}/kv/{key}", content=_dumps({"value": val}), headers=_JSON_HDR) #fa una richiesta HTTP PUT al backend specificato nell'URL
         #r è un codice di stato
         return r.status_code in (200, 201)
 
     except Exception:
         return False
     
+async def get_many(client: httpx.AsyncClient, base: str, keys: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Recupera più chiavi da un singolo backend KV con una POST su `{base}/kv/mget`.
+
+    Args:
+        client (httpx.AsyncClient): Client HTTP asincrono già aperto e riutilizzabile.
+        base (str): URL base del backend
+        keys (List[str]): Chiavi da leggere.
+
+    Returns:
+        Optional[Dict[str, Any]]:
+            - Mappa chiave -> valore (wrapped) con le sole chiavi presenti;
+              {} se il backend non è raggiungibile (come get_one: le chiavi risultano assenti).
+            - `None` se il backend non ha l'endpoint (kvstore vecchio, HTTP 404/405).
+    """
+    try:
+        r = await client.post(f"{base}/kv/mget", content=_dumps({"keys": keys}), headers=_JSON_HDR)
+        if r.status_code in (404, 405):
+            return None
+        r.raise_for_status()
+        return _loads(r.content)["values"]
+    except Exception:
+        return {}
+
 async def _repair_many(bases: list[str], key: str, wrapped_value: dict) -> None:
     """
     Esegue un'operazione di read-repair sincronizzata su più repliche.
@@ -297,12 +514,12 @@ async def _repair_many(bases: list[str], key: str, wrapped_value: dict) -> None:
         Gli errori vengono ignorati (best-effort): 
         le repliche non raggiungibili resteranno indietro.
     """
-    async with httpx.AsyncClient(timeout=2.0) as c: #Crea un client httpx temporaneo
-        # lancio in parallelo ma attendo che finiscano
-        tasks = [put_one(c, b, key, wrapped_value) for b in bases] #Costruisce tasks di put_one per tutti i backend da riparare
-        results = await asyncio.gather(*tasks, return_exceptions=True) #esegue in parallelo e aspetta che finiscano tutti;
-        #non alza eccezioni, le repliche non raggiungibili resteranno indietro
-        _ = results
+    c = backend_client()
+    # lancio in parallelo ma attendo che finiscano
+    tasks = [put_one(c, b, key, wrapped_value) for b in bases] #Costruisce tasks di put_one per tutti i backend da riparare
+    results = await asyncio.gather(*tasks, return_exceptions=True) #esegue in parallelo e aspetta che finiscano tutti;
+    #non alza eccezioni, le repliche non raggiungibili resteranno indietro
+    _ = results
 
 
 
@@ -319,35 +536,43 @@ def health():
             - status (str): "ok" se il processo è vivo.
             - backends (int): numero di backend configurati.
             - rf (int): replication factor effettivo (potrebbe essere ridotto rispetto all'env).
+            - hints_pending (int): hint in attesa di essere riconsegnati.
+            - hints_dropped (Dict[str, int]): hint scartati per backend a coda piena (dall'avvio).
     """
-    return {"status":"ok","backends":len(BACKENDS),"rf":RF}
+    return {"status":"ok","backends":len(BACKENDS),"rf":RF,
+            "hints_pending": sum(len(q) for q in _HINTS.values()), "hints_dropped": dict(_HINT_DROPS)}
 
-@app.get("/kv/{key}") #definisce l'endpoint http get
-async def get_key(key: str):
+async def _read_lww(c: httpx.AsyncClient, key: str) -> Tuple[bool, Any, float]:
     """
-    Legge una chiave replicata applicando LWW e fa read-repair best-effort.
-
-    Strategia:
-        - Raccoglie i valori da tutte le repliche del replica set della chiave.
-        - Sceglie il più recente usando LWW (confronto su timestamp interno "_ts").
-        - (Opz.) Esegue read-repair sulle repliche stantie che hanno risposto.
+    Legge una chiave da tutte le repliche, applica LWW e fa read-repair best-effort.
 
     Args:
+        c (httpx.AsyncClient): Client HTTP già aperto.
         key (str): Chiave logica da leggere.
 
     Returns:
-        dict: {"key": <key>, "value": <best_value>} dove <best_value> è il valore
-        "unwrapped" (senza metadati LWW).
-
-    
+        tuple[bool, Any, float]:
+            - True, il valore "unwrapped" e il suo timestamp LWW (fa da versione) se almeno una replica ha la chiave.
+            - False, None e -1.0 se la chiave non esiste su nessuna replica.
     """
     reps = replica_set(key) #calcola primario+secondari per la chiave chiamando la funzione responsabile 
-    if not reps:
-        raise HTTPException(503, "No backends") #alza l'errore se non crova un replica set
-    async with httpx.AsyncClient(timeout=2.0) as c: #crea un client http
-        vals = await asyncio.gather(*[get_one(c, b, key) for b in reps])  #legge in sincrono tutte le repliche tramite l'helper get_one avviando tante coroutine in parallelo
-        # l' * è per passare gli elementi della lista uno a uno 
-        #vals è una lista, uno per replica, che può contenere il valore wrappato o none (se la replica non ha la chiave)
+    vals = await asyncio.gather(*[get_one(c, b, key) for b in reps])  #legge in sincrono tutte le repliche tramite l'helper get_one avviando tante coroutine in parallelo
+    # l' * è per passare gli elementi della lista uno a uno 
+    #vals è una lista, uno per replica, che può contenere il valore wrappato o none (se la replica non ha la chiave)
+    return await _pick_lww(key, reps, vals)
+
+async def _pick_lww(key: str, reps: Tuple[str, ...], vals: List[Any]) -> Tuple[bool, Any, float]:
+    """
+    Applica LWW ai valori letti dalle repliche di una chiave e fa read-repair best-effort.
+
+    Args:
+        key (str): Chiave logica letta.
+        reps (tuple[str, ...]): Replica set della chiave.
+        vals (list): Valore wrapped letto da ciascuna replica (None se assente o non raggiungibile).
+
+    Returns:
+        tuple[bool, Any, float]: Come _read_lww.
+    """
     # scegli il più recente (LWW)
     best_ts, best_val, best_idx = -1.0, None, -1
     for i, v in enumerate(vals): #scorre tra le repliche
@@ -358,7 +583,7 @@ async def get_key(key: str):
             best_ts, best_val, best_idx = ts, data, i #identifica il valore più nuovo quindi con il ts più alto (bestval valore da restituire al client)
 
     if best_idx < 0:
-        raise HTTPException(404, "Key not found")
+        return False, None, -1.0
 
     # C2: read-repair: aggiorna repliche non allineate (best effort)
     if READ_REPAIR and best_ts >= 0: #best_ts >= 0 vuold ire che è stato trovato trovato almeno una replica valida
@@ -372,8 +597,81 @@ async def get_key(key: str):
                 to_fix.append(b) #aggiungiamo la replica in quelle da riparare
         if to_fix:
             await _repair_many(to_fix, key, wrapped)  #ripara le repliche stantie
+    return True, best_val, best_ts
+
+@app.get("/kv/{key}") #definisce l'endpoint http get
+async def get_key(key: str):
+    """
+    Legge una chiave replicata applicando LWW e fa read-repair best-effort.
+
+    Strategia:
+        - Raccoglie i valori da tutte le repliche del replica set della chiave.
+        - Sceglie il più recente usando LWW (confronto su timestamp interno "_ts").
+        - (Opz.) Esegue read-repair sulle repliche stantie che hanno risposto.
+
+    Args:
+        key (str): Chiave logica da leggere.
+
+    Returns:
+        dict: {"key": <key>, "value": <best_value>} dove <best_value> è il valore
+        "unwrapped" (senza metadati LWW).
+
+    
+    """
+    if not BACKENDS:
+        raise HTTPException(503, "No backends") #alza l'errore se non crova un replica set
+    c = backend_client()
+    found, best_val, _ = await _read_lww(c, key)
+    if not found:
+        raise HTTPException(404, "Key not found")
     return {"key": key, "value": best_val}
 
+@app.post("/kv/mget")
+async def mget(body: MgetModel):
+    """
+    Legge più chiavi in un'unica richiesta (stessa semantica LWW + read-repair di GET /kv/{key}).
+    Le chiavi sono raggruppate per backend: a ogni replica arriva una sola POST /kv/mget
+    (se i backend non la espongono si torna alle GET per chiave).
+
+    Se il client passa "versions" (chiave -> versione già in suo possesso), le chiavi ancora a
+    quella versione non vengono rispedite (come un If-None-Match per chiave).
+
+    Args:
+        body (MgetModel): JSON con il campo "keys" (lista di chiavi logiche) e, opzionale, "versions".
+
+    Returns:
+        dict: {"values": {<key>: <value> | None}}; le chiavi assenti valgono None.
+              Con "versions" nella richiesta: "values" contiene solo le chiavi cambiate,
+              "versions" la versione attuale di ogni chiave esistente e "unchanged" le chiavi omesse.
+    """
+    if not BACKENDS:
+        raise HTTPException(503, "No backends")
+    global _BACKEND_MGET_OK
+    keys = list(dict.fromkeys(body.keys))   #rimuove i duplicati mantenendo l'ordine
+    c = backend_client()
+    res = None
+    if _BACKEND_MGET_OK:
+        reps = {k: replica_set(k) for k in keys}
+        by_backend: Dict[str, List[str]] = {}
+        for k in keys:
+            for b in reps[k]:
+                by_backend.setdefault(b, []).append(k)  #raggruppa le chiavi per backend: una richiesta per backend, non per chiave
+        got = dict(zip(by_backend, await asyncio.gather(*[get_many(c, b, ks) for b, ks in by_backend.items()])))
+        if any(v is None for v in got.values()):
+            _BACKEND_MGET_OK = False    #kvstore senza /kv/mget: da qui in poi letture singole
+        else:
+            res = await asyncio.gather(*[_pick_lww(k, reps[k], [got[b].get(k) for b in reps[k]]) for k in keys])
+    if res is None:
+        res = await asyncio.gather(*[_read_lww(c, k) for k in keys])   #letture in parallelo di tutte le chiavi
+    if body.versions is None:
+        return {"values": {k: v for k, (_, v, _) in zip(keys, res)}}
+    known = body.versions
+    unchanged = [k for k, (found, _, ts) in zip(keys, res) if found and known.get(k) == ts]
+    skip = set(unchanged)
+    return {"values": {k: v for k, (_, v, _) in zip(keys, res) if k not in skip},
+            "versions": {k: ts for k, (found, _, ts) in zip(keys, res) if found},
+            "unchanged": unchanged}
+
 @app.put("/kv/{key}")
 async def put_key(key: str, body: ValueModel):
     """
@@ -401,20 +699,37 @@ async def put_key(key: str, body: ValueModel):
 
     wrapped = wrap(body.value) #incapsula il valore della chiave con il timestamp
     ok = 0 #Contatore di quante repliche hanno accettato la scrittura.
-    async with httpx.AsyncClient(timeout=2.0) as c: #crea un client http
-        for b in reps:  #itera su tutti i backend nel replica set
-            if await put_one(c, b, key, wrapped): #tenta di fare il put se va bene incrementa ok
-                ok += 1
-            else:#se non riesce 
-                # salva hint per backend b
-                _HINTS.setdefault(b, []).append((key, wrapped)) #.setdefault:Se _HINTS già contiene una lista per il backend b, la restituisce.
-                                                                 #Se invece b non è ancora presente, la aggiunge con valore [] (lista vuota) e poi restituisce quella lista.
-                                                                #Alla lista trovata o creata per b, aggiunge il nuovo elemento
+    c = backend_client()
+    for b in reps:  #itera su tutti i backend nel replica set
+        if await put_one(c, b, key, wrapped): #tenta di fare il put se va bene incrementa ok
+            ok += 1
+        else:#se non riesce 
+            # salva hint per backend b
+            add_hints(b, [(key, wrapped)]) #accoda l'hint nella coda di b (creata se non c'è ancora)
     if ok == 0:
         raise HTTPException(503, "Write failed on all replicas")
     # Nota: per Rf=2, rispondiamo OK anche con 1 replica (sloppy quorum via hint)
     return {"ok": True, "written": ok, "rf": RF}
 
+@app.post("/kv/mput")
+async def mput(body: MputModel):
+    """
+    Scrive più chiavi (stessa semantica LWW + hinted handoff di PUT /kv/{key}) in un'unica richiesta.
+    Le scritture sono indipendenti: non c'è semantica tutto-o-niente (per quella c'è /kv/txn).
+
+    Args:
+        body (MputModel): JSON con il campo "values" (mappa chiave -> valore).
+
+    Returns:
+        dict: {"results": {<key>: {"ok": True, "written": <n_ok>, "rf": <RF>} | {"ok": False}}}
+    """
+    if not BACKENDS:
+        raise HTTPException(503, "No backends")
+    keys = list(body.values)
+    res = await asyncio.gather(*[put_key(k, ValueModel(value=body.values[k])) for k in keys],
+                               return_exceptions=True)      #scritture in parallelo, ognuna col suo replica set
+    return {"results": {k: ({"ok": False} if isinstance(r, Exception) else r) for k, r in zip(keys, res)}}
+
 @app.post("/kv/cas")
 async def cas(body: CasModel):
     """
@@ -444,40 +759,246 @@ async def cas(body: CasModel):
         raise HTTPException(503, "No backends") #se non trova solleva l'errore
     primary, secondaries = reps[0], reps[1:] #salva in primaries il primo elemento di reps e in secondaries tutti gli altri
 
-    async with httpx.AsyncClient(timeout=2.0) as c:#crea un client
-        
-        cur_raw = await get_one(c, primary, body.key)  #leggo il VALORE CORRENTE (wrapped) dal primario
-        cur_unwrapped = unwrap(cur_raw)[1] if cur_raw is not None else None  #estrae solo il dato ignorando il timestamp.
-
-        # confronto lato front: se l'OLD richiesto dal client non coincide con lo stato attuale, fallisco
-        if cur_unwrapped != body.old: #se il valore estratto  è diverso da quello vecchio salvato nell'oggetto body
-            return {"ok": False, "current": cur_unwrapped}  #al client arriva l'ultimo valore effettivo della chiave
-
-      
-        new_wrapped = wrap(body.new) #Prepara il nuovo valore, incapsulato con timestamp
-
-        #CAS reale sul primario:  front-end KV non fa più controlli da solo, ma chiede al backend primario di eseguire la CAS.
-        #Perché solo il backend sa se nel frattempo qualcun altro ha scritto sulla stessa chiave.
-        r = await c.post(f"{primary}/kv/cas", json={
-            "key": body.key,  #la chiave da aggiornare
-            "old": cur_raw,     #valore WRAPPED intero letto poco prima dal primario che però tra il tempo di lettura e scrittura potrebbe essere stato cambiato da un altro client 
-            "new": new_wrapped   #nuovo valore wrapped che vogliamo scrivere
-        })  #r è la risposta HTTP dal backend primario
+    c = backend_client()
+
+    cur_raw = await get_one(c, primary, body.key)  #leggo il VALORE CORRENTE (wrapped) dal primario
+    cur_unwrapped = unwrap(cur_raw)[1] if cur_raw is not None else None  #estrae solo il dato ignorando il timestamp.
+
+    # confronto lato front: se l'OLD richiesto dal client non coincide con lo stato attuale, fallisco
+    if cur_unwrapped != body.old: #se il valore estratto  è diverso da quello vecchio salvato nell'oggetto body
+        return {"ok": False, "current": cur_unwrapped}  #al client arriva l'ultimo valore effettivo della chiave
+
+
+    new_wrapped = wrap(body.new) #Prepara il nuovo valore, incapsulato con timestamp
+
+    #CAS reale sul primario:  front-end KV non fa più controlli da solo, ma chiede al backend primario di eseguire la CAS.
+    #Perché solo il backend sa se nel frattempo qualcun altro ha scritto sulla stessa chiave.
+    r = await c.post(f"{primary}/kv/cas", headers=_JSON_HDR, content=_dumps({
+        "key": body.key,  #la chiave da aggiornare
+        "old": cur_raw,     #valore WRAPPED intero letto poco prima dal primario che però tra il tempo di lettura e scrittura potrebbe essere stato cambiato da un altro client 
+        "new": new_wrapped   #nuovo valore wrapped che vogliamo scrivere
+    }))  #r è la risposta HTTP dal backend primario
+    r.raise_for_status()
+    resp = _loads(r.content)  #trasformiamo la risposta in un dizionario python che ha la chiave ok (valore:true/false) e la chiave current (valore: il dato wrappato)
+    if not resp.get("ok"): #se fallisce il front riporta al client il valore attuale che ha vinto
+
+        current_backend = resp.get("current") #restituisce il valore del campo current della risposta
+        current_unwrapped = unwrap(current_backend)[1] if current_backend is not None else None #estrae solo il dato logico senza ts
+        return {"ok": False, "current": current_unwrapped} #risponde al client
+
+
+    for b in secondaries:#Se il primario ha accettato la CAS, il nuovo valore va replicato anche sui secondari.
+        if not await put_one(c, b, body.key, new_wrapped): #prova put_one se non va accoda la key e il valore in _HINTS per quel backend
+            add_hints(b, [(body.key, new_wrapped)])
+
+    return {"ok": True}
+
+@app.post("/kv/mcas")
+async def mcas(body: McasModel):
+    """
+    Esegue più CAS (stessa semantica di POST /kv/cas) in un'unica richiesta.
+    Le operazioni sono indipendenti: non c'è semantica tutto-o-niente (per quella c'è /kv/txn).
+
+    Args:
+        body (McasModel): JSON con il campo "ops" (lista di {"key", "old", "new"}).
+
+    Returns:
+        dict: {"results": [{"ok": True} | {"ok": False, "current": <val>}, ...]} nello stesso ordine di "ops".
+    """
+    res = await asyncio.gather(*[cas(op) for op in body.ops])     #le CAS in parallelo, ognuna col suo primario
+    return {"results": list(res)}
+
+@app.post("/kv/idem_claim")
+async def idem_claim(body: IdemClaimModel):
+    """
+    Prenota una Idempotency-Key in un'unica richiesta: se la chiave è libera la associa a
+    "tentative_id" (CAS None → tentative_id), altrimenti restituisce l'ID già associato
+    insieme al suo documento (se esiste).
+
+    Args:
+        body (IdemClaimModel): JSON con i campi "key", "tentative_id" e "delivery_key_prefix".
+
+    Returns:
+        dict: {"claimed": bool, "winner_id": <id>, "value": <documento di prefix+winner_id> | None};
+              con "claimed" True il documento non viene letto (è una chiave nuova).
+    """
+    res = await cas(CasModel(key=body.key, old=None, new=body.tentative_id))
+    if res["ok"]:
+        return {"claimed": True, "winner_id": body.tentative_id, "value": None}
+    winner = res.get("current")                                 #l'ID di chi ha usato la chiave per primo
+    c = backend_client()
+    _, doc, _ = await _read_lww(c, f"{body.delivery_key_prefix}{winner}")
+    return {"claimed": False, "winner_id": winner, "value": doc}
+
+PATCH_CAS_ATTEMPTS = 8                                          #retry interni quando la CAS sul primario perde una race
+TXN_UNDO_ATTEMPTS  = 4                                          #tentativi per ogni patch di compensazione di /kv/txn
+
+@app.post("/kv/patch_cas")
+async def patch_cas(body: PatchCasModel):
+    """
+    CAS su un sottoinsieme di campi di un documento dict, consistente col primario.
+
+    Strategia:
+        1) Legge il valore corrente (wrapped) dal primario.
+        2) Verifica i campi di "if" (uguaglianza) e di "min" (soglia numerica): se anche uno non torna → fail.
+        3) Applica "set"/"unset" su una copia e fa la CAS reale sul primario
+           col valore wrapped appena letto; se perde la race rilegge e riprova.
+        4) Se il primario conferma → replica best-effort sui secondari.
+
+    Args:
+        body (PatchCasModel): JSON con campi "key", "if", "min", "set", "unset".
+
+    Returns:
+        dict:
+          - {"ok": True, "value": <documento scritto>, "version": <timestamp LWW>} se la patch è stata applicata.
+          - {"ok": False, "exists": <bool>} se la condizione non è verificata
+            (exists=False se la chiave non esiste o non è un dict).
+          - {"ok": False, "exists": True, "conflict": True} se i retry sono esauriti.
+    """
+    c = backend_client()
+    res = await _apply_patch(c, body.key, body.if_equals, body.if_min, body.set_to, body.unset)
+    res.pop("undo", None)
+    return res
+
+async def _apply_patch(c: httpx.AsyncClient, key: str, if_equals: Dict[str, Any], if_min: Dict[str, float],
+                       set_to: Dict[str, Any], unset: List[str]) -> Dict[str, Any]:
+    """
+    Corpo di patch_cas (vedi sopra), riusato anche da txn.
+
+    Args:
+        c (httpx.AsyncClient): Client verso i backend.
+        key (str): Chiave logica.
+        if_equals, if_min, set_to, unset: Come in PatchCasModel.
+
+    Returns:
+        dict: Come patch_cas; se la patch è applicata contiene anche "undo",
+              la patch inversa (if/set/unset) che ripristina i campi toccati.
+    """
+    reps = replica_set(key)
+    if not reps:
+        raise HTTPException(503, "No backends")
+    primary, secondaries = reps[0], reps[1:]
+
+    for _ in range(PATCH_CAS_ATTEMPTS):
+        cur_raw = await get_one(c, primary, key)
+        cur = unwrap(cur_raw)[1] if cur_raw is not None else None
+        if not isinstance(cur, dict):
+            return {"ok": False, "exists": False}
+        if any(cur.get(f) != v for f, v in if_equals.items()):                 #condizione verificata lato server: il client non invia il documento
+            return {"ok": False, "exists": True}
+        if any(not isinstance(cur.get(f), (int, float)) or cur.get(f) < v for f, v in if_min.items()):
+            return {"ok": False, "exists": True}
+
+        new = dict(cur)
+        new.update(set_to)
+        for f in unset:
+            new.pop(f, None)
+        new_wrapped = wrap(new)
+
+        r = await c.post(f"{primary}/kv/cas", content=_dumps({"key": key, "old": cur_raw, "new": new_wrapped}), headers=_JSON_HDR)
         r.raise_for_status()
-        resp = r.json()  #trasformiamo la risposta in un dizionario python che ha la chiave ok (valore:true/false) e la chiave current (valore: il dato wrappato)
-        if not resp.get("ok"): #se fallisce il front riporta al client il valore attuale che ha vinto
-            
-            current_backend = resp.get("current") #restituisce il valore del campo current della risposta
-            current_unwrapped = unwrap(current_backend)[1] if current_backend is not None else None #estrae solo il dato logico senza ts
-            return {"ok": False, "current": current_unwrapped} #risponde al client
-
-        
-        for b in secondaries:#Se il primario ha accettato la CAS, il nuovo valore va replicato anche sui secondari.
-            if not await put_one(c, b, body.key, new_wrapped): #prova put_one se non va accoda la key e il valore in _HINTS per quel backend
-                _HINTS.setdefault(b, []).append((body.key, new_wrapped))
+        if not _loads(r.content).get("ok"):                                  #qualcun altro ha scritto nel frattempo: rilegge e ricontrolla la condizione
+            continue
+
+        for b in secondaries:
+            if not await put_one(c, b, key, new_wrapped):
+                add_hints(b, [(key, new_wrapped)])
+        touched = list(set_to) + [f for f in unset if f not in set_to]
+        undo = {"if": {f: new[f] for f in set_to},                  #valori appena scritti: l'undo vale solo se nessuno li ha cambiati
+                "set": {f: cur[f] for f in touched if f in cur},
+                "unset": [f for f in touched if f not in cur]}
+        return {"ok": True, "value": new, "version": new_wrapped["_ts"], "undo": undo}
+
+    return {"ok": False, "exists": True, "conflict": True}
+
+@app.post("/kv/mpatch")
+async def mpatch(body: MpatchModel):
+    """
+    Applica più CAS a patch (stessa semantica di POST /kv/patch_cas) in un'unica richiesta.
+    Le patch sono indipendenti e vanno in parallelo: non c'è semantica tutto-o-niente (per quella c'è /kv/txn).
+
+    Args:
+        body (MpatchModel): JSON con il campo "ops" (lista di patch come in /kv/patch_cas).
 
+    Returns:
+        dict: {"results": [<risposta di patch_cas>, ...]} nello stesso ordine di "ops".
+    """
+    async def one(c: httpx.AsyncClient, op: PatchCasModel) -> Dict[str, Any]:
+        try:
+            res = await _apply_patch(c, op.key, op.if_equals, op.if_min, op.set_to, op.unset)
+        except Exception:                                           #backend irraggiungibile: fallisce solo questa patch
+            return {"ok": False, "exists": True}
+        res.pop("undo", None)
+        return res
+
+    c = backend_client()
+    res = await asyncio.gather(*[one(c, op) for op in body.ops])
+    return {"results": list(res)}
+
+@app.post("/kv/txn")
+async def txn(body: TxnModel):
+    """
+    Applica più CAS a patch (anche su chiavi con primari diversi) con semantica tutto-o-niente.
+
+    Strategia:
+        1) Applica le patch nell'ordine ricevuto, ognuna come patch_cas.
+        2) Alla prima che fallisce, annulla quelle già applicate (in ordine inverso)
+           con la patch inversa, a sua volta condizionata ai valori appena scritti.
+    Non c'è isolamento tra le due patch: per un istante la prima può essere visibile da sola.
+
+    Args:
+        body (TxnModel): JSON con il campo "ops" (lista di patch come in /kv/patch_cas).
+
+    Returns:
+        dict:
+          - {"ok": True} se tutte le patch sono state applicate.
+          - {"ok": False, "failed": <indice>, "exists": <bool>} altrimenti; se qualche
+            compensazione non è andata a buon fine c'è anche "compensation_failed": [<chiavi>]
+            (quelle chiavi restano con la patch applicata e vanno riconciliate dal chiamante).
+    """
+    done = []
+    c = backend_client()
+    for i, op in enumerate(body.ops):
+        try:
+            res = await _apply_patch(c, op.key, op.if_equals, op.if_min, op.set_to, op.unset)
+        except Exception:                                       #backend irraggiungibile: si tratta come un fallimento
+            res = {"ok": False, "exists": True}
+        if res.get("ok"):
+            done.append((op.key, res["undo"]))
+            continue
+        out = {"ok": False, "failed": i, "exists": bool(res.get("exists"))}
+        undo_failed = [key for key, undo in reversed(done)       #compensazione: rimette i campi toccati com'erano
+                       if not await _undo_patch(c, key, undo)]
+        if undo_failed:
+            out["compensation_failed"] = undo_failed
+        return out
     return {"ok": True}
 
+async def _undo_patch(c: httpx.AsyncClient, key: str, undo: Dict[str, Any]) -> bool:
+    """
+    Applica una patch di compensazione di txn, riprovando su errori dei backend e race esaurite.
+
+    Args:
+        c (httpx.AsyncClient): Client verso i backend.
+        key (str): Chiave logica.
+        undo (dict): Patch inversa restituita da _apply_patch ({"if", "set", "unset"}).
+
+    Returns:
+        bool: True se la patch è stata annullata; False se i tentativi sono finiti o se i campi
+              scritti sono già stati cambiati da qualcun altro (l'undo non si può più applicare).
+    """
+    for attempt in range(TXN_UNDO_ATTEMPTS):
+        try:
+            res = await _apply_patch(c, key, undo["if"], {}, undo["set"], undo["unset"])
+        except Exception:
+            res = {"ok": False, "conflict": True}
+        if res.get("ok"):
+            return True
+        if not res.get("conflict"):                             #condizione falsa: non è una race, riprovare non serve
+            return False
+        await asyncio.sleep(0.02 * (attempt + 1))
+    return False
+
 
 
 
@@ -501,12 +1022,12 @@ async def lock_acquire(key: str, ttl_sec: int = 30):
     if not reps:
         raise HTTPException(503, "No backends")
     primary = reps[0] #prende il primario 
-    async with httpx.AsyncClient(timeout=2.0) as c: #crea il client 
-        try:
-            r = await c.post(f"{primary}/lock/acquire/{key}", params={"ttl_sec": ttl_sec}) #invia una richiesta all'endpoint post 
-            return r.json() #prende la risposta e la converte in json e la restituisce. Se trova il campo ttl già inserito fallisce il lock
-        except Exception:
-            raise HTTPException(503, "Lock backend unavailable")
+    c = backend_client()
+    try:
+        r = await c.post(f"{primary}/lock/acquire/{key}", params={"ttl_sec": ttl_sec}) #invia una richiesta all'endpoint post 
+        return _loads(r.content) #prende la risposta e la converte in json e la restituisce. Se trova il campo ttl già inserito fallisce il lock
+    except Exception:
+        raise HTTPException(503, "Lock backend unavailable")
 
 @app.post("/lock/release/{key}") #Definisce l’endpoint HTTP POST su /lock/release/<key>.
 async def lock_release(key: str):
@@ -524,9 +1045,9 @@ async def lock_release(key: str):
     if not reps:
         raise HTTPException(503, "No backends")
     primary = reps[0]
-    async with httpx.AsyncClient(timeout=2.0) as c: #crea il client http
-        try:
-            r = await c.post(f"{primary}/lock/release/{key}")#Fa una richiesta POST verso il backend primario sull’endpoint /lock/release/<key>.
-            return r.json()  #restituisce sempre la risposta
-        except Exception:
-            raise HTTPException(503, "Lock backend unavailable")
\ No newline at end of file
+    c = backend_client()
+    try:
+        r = await c.post(f"{primary}/lock/release/{key}")#Fa una richiesta POST verso il backend primario sull’endpoint /lock/release/<key>.
+        return _loads(r.content)  #restituisce sempre la risposta
+    except Exception:
+        raise HTTPException(503, "Lock backend unavailable")
\ No newline at end of file
@@ -4,7 +4,7 @@ import json
 import sqlite3
 import threading
 from collections import OrderedDict
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional
 
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
@@ -250,6 +250,31 @@ def db_get(key: str) -> Optional[Any]:
         # Fallback: se per qualche motivo non è JSON
         return row[0]
 
+def db_mget(keys: List[str]) -> Dict[str, Any]:
+    """
+    Recupera più valori dal DB SQLite con una sola query (WHERE key IN ...).
+
+    Args:
+        keys (List[str]): Le chiavi da cercare.
+
+    Returns:
+        Dict[str, Any]: Mappa chiave -> valore deserializzato, solo per le chiavi trovate
+                        (stesso fallback di db_get sui valori non JSON).
+    """
+    out: Dict[str, Any] = {}
+    for i in range(0, len(keys), 500):  #a blocchi: SQLite limita il numero di parametri di una query
+        part = keys[i:i+500]
+        with _db_lock: #Serve a fare in modo che solo un thread per volta entri nella sezione 
+            rows = _conn.execute(
+                f"SELECT key, value FROM kv_store WHERE key IN ({','.join('?' * len(part))});", part
+            ).fetchall()
+        for k, raw in rows:
+            try:
+                out[k] = json.loads(raw)
+            except Exception:
+                out[k] = raw
+    return out
+
 def db_put(key: str, value: Any) -> None:
     """
     Inserisce o aggiorna un valore nel DB SQLite per la chiave data.
@@ -356,6 +381,15 @@ class CasModel(BaseModel):
     old: Any
     new: Any
 
+class MgetModel(BaseModel):
+    """
+    Modello Pydantic per la richiesta POST su /kv/mget.
+
+    Attributes:
+        keys (List[str]): Le chiavi da leggere in un'unica richiesta.
+    """
+    keys: List[str]
+
 # ======================
 # API
 # ======================
@@ -396,6 +430,32 @@ def get_key(key: str):
     CACHE.put(key, v) #aggiorna la cache in modo che questo sia l'ultimo valore usato
     return {"key": key, "value": v}
 
+@app.post("/kv/mget")
+def mget(body: MgetModel):
+    """
+    Recupera più chiavi in una volta: prima dalla cache, le mancanti con una sola query al DB.
+
+    Args:
+        body (MgetModel): Oggetto con il campo "keys".
+
+    Returns:
+        dict: JSON {"values": {<key>: <value>}} con le sole chiavi esistenti.
+    """
+    out: Dict[str, Any] = {}
+    miss: List[str] = []
+    for k in body.keys:
+        v = CACHE.get(k) #cerca la chiave nella cache
+        if v is not None:
+            out[k] = v
+        else:
+            miss.append(k)
+    if miss:
+        found = db_mget(miss) #chiede le altre al db in blocco
+        for k, v in found.items():
+            CACHE.put(k, v) #come get_key: aggiorna la cache
+        out.update(found)
+    return {"values": out}
+
 @app.put("/kv/{key}")
 def put_key(key: str, body: ValueModel):
     """
@@ -102,6 +102,16 @@ lb_post_delivery(){
 # Lettura diretta KV (come nei test KV) per assert su documents
 kv_get_json(){ local key="$1"; curl -sf "${KV_URL}/kv/${key}" | ${JQ} -rc '.value // empty'; }
 
+# deliveries_index è diviso in shard deliveries_index:{0..K-1} (K in deliveries_index_meta):
+# stampa un unico array JSON con la vecchia lista unica seguita da tutti gli shard
+deliveries_index_all(){
+  local k shards; shards="$(kv_get_json deliveries_index_meta | ${JQ} -r '.shards // 0')"
+  [[ "$shards" =~ ^[0-9]+$ ]] || shards=0
+  { kv_get_json deliveries_index
+    for (( k=0; k<shards; k++ )); do kv_get_json "deliveries_index:${k}"; done
+  } | ${JQ} -sc '[.[] | select(type=="array") | .[]]'
+}
+
 # Crea una consegna realistica (usa bounds di /zones)
 mk_random_payload(){
   local b="$(lb_get /zones | ${JQ} -c '.bounds')"
@@ -179,9 +189,14 @@ test_delivery_idempotency(){
   local ddoc; ddoc="$(kv_get_json "delivery:${id1}")"
   echo "$ddoc" | grep -q "\"id\":\"$id1\"" || { red "FAIL: delivery mancante su KV"; return 1; }
 
-  # assert su deliveries_index: id presente una sola volta
-  local idx; idx="$(kv_get_json "deliveries_index")"
-  local count; count="$(echo "$idx" | ${JQ} -r --arg id "$id1" '[.[] | select(.==$id)] | length')"
+  # assert su deliveries_index (tutti gli shard): id presente una sola volta
+  # l'indicizzazione avviene in background dopo la risposta: attende fino a ~5s
+  local count="0" i
+  for (( i=0; i<25; i++ )); do
+    count="$(deliveries_index_all | ${JQ} -r --arg id "$id1" '[.[] | select(.==$id)] | length')"
+    [[ "$count" == "0" ]] || break
+    sleep 0.2
+  done
   echo "$count"
   [[ "$count" == "1" ]] || { red "FAIL: deliveries_index contiene duplicati ($count)"; return 1; }
 
@@ -406,12 +421,12 @@ test_ordergen_smoke_optional(){
     return 0
   fi
 
-  # Leggo la lunghezza dell'indice globale (illimitato)
-  # NB: se la chiave non esiste ancora, jq fallirebbe: gestisco il caso null->0
+  # Leggo la lunghezza dell'indice globale (illimitato, somma di tutti gli shard)
+  # NB: chiavi ancora assenti contano 0 (deliveries_index_all restituisce comunque un array)
   local c1 c2
-  c1="$(kv_get_json 'deliveries_index' | ${JQ} -r 'if .==null then 0 else length end')"
+  c1="$(deliveries_index_all | ${JQ} -r 'length')"
   nap 45   # puoi tenere 30–60s; hai già messo SILENT=0 quindi 30-45s bastano
-  c2="$(kv_get_json 'deliveries_index' | ${JQ} -r 'if .==null then 0 else length end')"
+  c2="$(deliveries_index_all | ${JQ} -r 'length')"
 
   log "deliveries_index prima=${c1} dopo=~45s -> ${c2}"
   [[ "$c2" -gt "$c1" ]] || { red "FAIL: atteso incremento consegne con ordergen attivo"; return 1; }
@@ -3,6 +3,8 @@
 # KV TESTS — kvfront + kvstore_a/b/c (KV-only)
 #   - RF=2, LWW, CAS, Read-Repair, Hinted-Handoff,
 #     Distribuzione repliche, Lock, Hashing, Cache, Resilienza
+#   - Endpoint batch/condizionali: mget (+versions), mput, mcas,
+#     patch_cas, mpatch, txn (+compensazione), idem_claim, mget dei kvstore
 #   - Dati "reali" (delivery:*, drone:*, ecc.)
 # ============================================
 
@@ -122,6 +124,24 @@ PY
 }
 
 
+# ============================================================
+# Funzione: kv_post
+# Descrizione:
+#   POST di un corpo JSON a un endpoint del kvfront
+#   (mget, mput, mcas, mpatch, patch_cas, txn, idem_claim).
+#
+# Parametri:
+#   $1 = path (es. /kv/mget)
+#   $2 = body (JSON)
+#
+# Output:
+#   Stampa su stdout la risposta JSON (compatta).
+# ============================================================
+kv_post() { # path body
+  local path="$1" body="$2"
+  curl -sf -X POST -H "Content-Type: application/json" -d "$body" "${KV_FRONT}${path}" | ${JQ} -c .
+}
+
 # ============================================================
 # Funzione: stop_backend_b
 # Descrizione:
@@ -577,6 +597,243 @@ test_backend_restart_resilience(){
   green "PASS: dato servibile dopo restart ✔"
 }
 
+# ============================================================
+# TEST 10 — MGET via front (+ versions/unchanged)
+# Scopo:
+#   Verificare POST /kv/mget del kvfront:
+#     - restituisce tutte le chiavi richieste (None per le assenti),
+#     - con "versions" non rispedisce le chiavi ancora a quella versione
+#       ("unchanged") e rimanda solo quelle cambiate.
+#
+# Passi:
+#   1) Scrive due chiavi via front.
+#   2) MGET semplice (anche su una chiave assente).
+#   3) MGET con versions={} → legge le versioni attuali.
+#   4) MGET con quelle versioni → entrambe "unchanged", "values" vuoto.
+#   5) Riscrive una chiave e ripete: solo quella torna in "values".
+# ============================================================
+test_mget_versions(){
+  section "TEST 10: MGET via front (+ versions/unchanged)"
+
+  local k1="delivery:test-mget-1" k2="delivery:test-mget-2" kx="delivery:test-mget-missing"
+  kv_put_obj "$k1" '{"id":"test-mget-1","status":"pending","weight":1.0}'
+  kv_put_obj "$k2" '{"id":"test-mget-2","status":"pending","weight":2.0}'
+
+  local r; r="$(kv_post /kv/mget "{\"keys\":[\"$k1\",\"$k2\",\"$kx\"]}")"
+  log "mget -> $r"
+  echo "$r" | ${JQ} -e --arg k1 "$k1" --arg k2 "$k2" --arg kx "$kx" \
+    '.values[$k1].id=="test-mget-1" and .values[$k2].id=="test-mget-2" and (.values|has($kx)) and .values[$kx]==null' >/dev/null \
+    || { red "FAIL: mget semplice"; return 1; }
+
+  local vers; vers="$(kv_post /kv/mget "{\"keys\":[\"$k1\",\"$k2\"],\"versions\":{}}" | ${JQ} -c .versions)"
+  log "versioni -> $vers"
+  r="$(kv_post /kv/mget "{\"keys\":[\"$k1\",\"$k2\"],\"versions\":${vers}}")"
+  echo "$r" | ${JQ} -e '(.values|length)==0 and (.unchanged|length)==2' >/dev/null \
+    || { red "FAIL: con le versioni attuali nessuna chiave va rispedita ($r)"; return 1; }
+
+  kv_put_obj "$k1" '{"id":"test-mget-1","status":"assigned","weight":1.0}'
+  r="$(kv_post /kv/mget "{\"keys\":[\"$k1\",\"$k2\"],\"versions\":${vers}}")"
+  log "mget dopo la riscrittura -> $r"
+  echo "$r" | ${JQ} -e --arg k1 "$k1" --arg k2 "$k2" \
+    '.values[$k1].status=="assigned" and (.values|has($k2)|not) and .unchanged==[$k2] and .versions[$k1] > '"$(echo "$vers" | ${JQ} --arg k1 "$k1" '.[$k1]')" >/dev/null \
+    || { red "FAIL: la chiave cambiata doveva tornare in values"; return 1; }
+  green "PASS: mget + versions/unchanged ✔"
+}
+
+# ============================================================
+# TEST 11 — MPUT + MCAS via front
+# Scopo:
+#   Verificare le scritture multiple in un'unica richiesta:
+#     - /kv/mput scrive tutte le chiavi (ognuna col suo replica set),
+#     - /kv/mcas esegue CAS indipendenti: una riesce, una fallisce
+#       e restituisce il valore corrente.
+# ============================================================
+test_mput_mcas(){
+  section "TEST 11: MPUT + MCAS via front"
+
+  local k1="drone:test-mput-1" k2="drone:test-mput-2"
+  local d1='{"id":"test-mput-1","status":"idle","battery":90}'
+  local d2='{"id":"test-mput-2","status":"idle","battery":70}'
+  local r; r="$(kv_post /kv/mput "{\"values\":{\"$k1\":$d1,\"$k2\":$d2}}")"
+  log "mput -> $r"
+  echo "$r" | ${JQ} -e '[.results[].ok]|all and length==2' >/dev/null || { red "FAIL: mput"; return 1; }
+  kv_get "$k1" | grep -q '"battery":90' || { red "FAIL: mput non ha scritto $k1"; return 1; }
+  kv_get "$k2" | grep -q '"battery":70' || { red "FAIL: mput non ha scritto $k2"; return 1; }
+
+  local n1='{"id":"test-mput-1","status":"busy","battery":90}'
+  local wrong='{"id":"test-mput-2","status":"busy","battery":70}'
+  local n2='{"id":"test-mput-2","status":"charging","battery":70}'
+  r="$(kv_post /kv/mcas "{\"ops\":[{\"key\":\"$k1\",\"old\":$d1,\"new\":$n1},{\"key\":\"$k2\",\"old\":$wrong,\"new\":$n2}]}")"
+  log "mcas -> $r"
+  echo "$r" | ${JQ} -e '.results[0].ok==true and .results[1].ok==false and .results[1].current.status=="idle"' >/dev/null \
+    || { red "FAIL: mcas (atteso ok / ko con current)"; return 1; }
+  kv_get "$k1" | grep -q '"status":"busy"' || { red "FAIL: mcas non ha scritto $k1"; return 1; }
+  kv_get "$k2" | grep -q '"status":"idle"' || { red "FAIL: mcas fallita ha scritto $k2"; return 1; }
+  green "PASS: mput + mcas ✔"
+}
+
+# ============================================================
+# TEST 12 — PATCH_CAS via front (if/min/set/unset)
+# Scopo:
+#   Verificare la CAS a patch:
+#     - condizioni "if" e "min" verificate → applica "set" e "unset"
+#       lasciando intatti gli altri campi,
+#     - "if" falsa → ok=false, exists=true, documento invariato,
+#     - "min" non raggiunta → ok=false,
+#     - chiave assente → ok=false, exists=false.
+# ============================================================
+test_patch_cas(){
+  section "TEST 12: PATCH_CAS via front (if/min/set/unset)"
+
+  local key="drone:test-patch-1"
+  kv_put_obj "$key" '{"id":"test-patch-1","status":"idle","battery":60,"feas_miss":2,"pos":{"lat":41.9,"lon":12.5}}'
+
+  local r; r="$(kv_post /kv/patch_cas "{\"key\":\"$key\",\"if\":{\"status\":\"idle\"},\"min\":{\"battery\":50},\"set\":{\"status\":\"busy\",\"current_delivery\":\"D-P\"},\"unset\":[\"feas_miss\"]}")"
+  log "patch_cas -> $r"
+  echo "$r" | ${JQ} -e '.ok==true and .value.status=="busy" and (.value|has("feas_miss")|not) and .version>0' >/dev/null \
+    || { red "FAIL: patch_cas (condizioni vere)"; return 1; }
+  kv_get "$key" | ${JQ} -e '.status=="busy" and .current_delivery=="D-P" and (has("feas_miss")|not) and .pos.lat==41.9 and .battery==60' >/dev/null \
+    || { red "FAIL: documento dopo patch_cas"; return 1; }
+
+  r="$(kv_post /kv/patch_cas "{\"key\":\"$key\",\"if\":{\"status\":\"idle\"},\"set\":{\"status\":\"charging\"}}")"
+  echo "$r" | ${JQ} -e '.ok==false and .exists==true' >/dev/null || { red "FAIL: patch_cas con if falsa ($r)"; return 1; }
+
+  r="$(kv_post /kv/patch_cas "{\"key\":\"$key\",\"min\":{\"battery\":80},\"set\":{\"status\":\"charging\"}}")"
+  echo "$r" | ${JQ} -e '.ok==false' >/dev/null || { red "FAIL: patch_cas con min non raggiunta ($r)"; return 1; }
+  kv_get "$key" | grep -q '"status":"busy"' || { red "FAIL: patch_cas fallita ha scritto"; return 1; }
+
+  r="$(kv_post /kv/patch_cas '{"key":"drone:test-patch-missing","set":{"status":"idle"}}')"
+  echo "$r" | ${JQ} -e '.ok==false and .exists==false' >/dev/null || { red "FAIL: patch_cas su chiave assente ($r)"; return 1; }
+  green "PASS: patch_cas if/min/set/unset ✔"
+}
+
+# ============================================================
+# TEST 13 — MPATCH via front
+# Scopo:
+#   Verificare più CAS a patch indipendenti in un'unica richiesta:
+#   i risultati sono nell'ordine di "ops" e una patch fallita non
+#   blocca le altre.
+# ============================================================
+test_mpatch(){
+  section "TEST 13: MPATCH via front"
+
+  local k1="drone:test-mpatch-1" k2="drone:test-mpatch-2"
+  kv_put_obj "$k1" '{"id":"test-mpatch-1","status":"idle","battery":80}'
+  kv_put_obj "$k2" '{"id":"test-mpatch-2","status":"charging","battery":20}'
+
+  local r; r="$(kv_post /kv/mpatch "{\"ops\":[{\"key\":\"$k1\",\"if\":{\"status\":\"idle\"},\"set\":{\"battery\":75}},{\"key\":\"$k2\",\"if\":{\"status\":\"idle\"},\"set\":{\"battery\":99}}]}")"
+  log "mpatch -> $r"
+  echo "$r" | ${JQ} -e '.results[0].ok==true and .results[1].ok==false and .results[1].exists==true' >/dev/null \
+    || { red "FAIL: mpatch (atteso ok / ko)"; return 1; }
+  kv_get "$k1" | grep -q '"battery":75' || { red "FAIL: mpatch non ha scritto $k1"; return 1; }
+  kv_get "$k2" | grep -q '"battery":20' || { red "FAIL: mpatch fallita ha scritto $k2"; return 1; }
+  green "PASS: mpatch ✔"
+}
+
+# ============================================================
+# TEST 14 — TXN via front (tutto-o-niente + compensazione)
+# Scopo:
+#   Verificare /kv/txn sulla coppia drone/delivery dell'assegnazione:
+#     - se tutte le patch riescono, le scrive tutte,
+#     - se la seconda fallisce, la prima (già applicata) viene annullata
+#       dalla compensazione e il risultato indica la patch fallita.
+#
+# Passi:
+#   1) Drone idle + delivery pending → txn riesce (busy/assigned).
+#   2) Drone idle + delivery già assegnata ad altri → txn fallisce
+#      con failed=1 e il drone torna idle senza current_delivery.
+# ============================================================
+test_txn_compensation(){
+  section "TEST 14: TXN via front (tutto-o-niente + compensazione)"
+
+  local dk="drone:test-txn-1" xk="delivery:test-txn-1"
+  kv_put_obj "$dk" '{"id":"test-txn-1","status":"idle","current_delivery":null,"battery":90}'
+  kv_put_obj "$xk" '{"id":"test-txn-1","status":"pending","drone_id":null}'
+
+  local ops="[{\"key\":\"$dk\",\"if\":{\"status\":\"idle\",\"current_delivery\":null},\"set\":{\"status\":\"busy\",\"current_delivery\":\"test-txn-1\"}},{\"key\":\"$xk\",\"if\":{\"status\":\"pending\",\"drone_id\":null},\"set\":{\"status\":\"assigned\",\"drone_id\":\"test-txn-1\"}}]"
+  local r; r="$(kv_post /kv/txn "{\"ops\":$ops}")"
+  log "txn -> $r"
+  echo "$r" | ${JQ} -e '.ok==true' >/dev/null || { red "FAIL: txn con condizioni vere"; return 1; }
+  kv_get "$dk" | grep -q '"status":"busy"'     || { red "FAIL: txn non ha scritto il drone"; return 1; }
+  kv_get "$xk" | grep -q '"status":"assigned"' || { red "FAIL: txn non ha scritto la delivery"; return 1; }
+
+  # Compensazione: drone di nuovo idle, delivery già assegnata a un altro drone
+  kv_put_obj "$dk" '{"id":"test-txn-1","status":"idle","current_delivery":null,"battery":90}'
+  kv_put_obj "$xk" '{"id":"test-txn-1","status":"assigned","drone_id":"other"}'
+  r="$(kv_post /kv/txn "{\"ops\":$ops}")"
+  log "txn (seconda patch falsa) -> $r"
+  echo "$r" | ${JQ} -e '.ok==false and .failed==1 and .exists==true and (has("compensation_failed")|not)' >/dev/null \
+    || { red "FAIL: txn doveva fallire sulla seconda patch"; return 1; }
+  kv_get "$dk" | ${JQ} -e '.status=="idle" and .current_delivery==null and .battery==90' >/dev/null \
+    || { red "FAIL: compensazione non ha ripristinato il drone"; return 1; }
+  kv_get "$xk" | grep -q '"drone_id":"other"' || { red "FAIL: delivery modificata"; return 1; }
+  green "PASS: txn tutto-o-niente + compensazione ✔"
+}
+
+# ============================================================
+# TEST 15 — IDEM_CLAIM via front
+# Scopo:
+#   Verificare la prenotazione di una Idempotency-Key:
+#     - la prima richiesta la prenota (claimed=true),
+#     - la seconda (con un altro tentative_id) riceve l'ID vincente
+#       e il documento associato.
+# ============================================================
+test_idem_claim(){
+  section "TEST 15: IDEM_CLAIM via front"
+
+  local ik="idem:test-idem-$RANDOM-$RANDOM"
+  kv_put_obj "delivery:test-idem-A" '{"id":"test-idem-A","status":"pending","weight":1.5}'
+
+  local r; r="$(kv_post /kv/idem_claim "{\"key\":\"$ik\",\"tentative_id\":\"test-idem-A\"}")"
+  log "idem_claim #1 -> $r"
+  echo "$r" | ${JQ} -e '.claimed==true and .winner_id=="test-idem-A" and .value==null' >/dev/null \
+    || { red "FAIL: prima prenotazione"; return 1; }
+
+  r="$(kv_post /kv/idem_claim "{\"key\":\"$ik\",\"tentative_id\":\"test-idem-B\"}")"
+  log "idem_claim #2 -> $r"
+  echo "$r" | ${JQ} -e '.claimed==false and .winner_id=="test-idem-A" and .value.id=="test-idem-A"' >/dev/null \
+    || { red "FAIL: la seconda prenotazione doveva restituire il vincente"; return 1; }
+  green "PASS: idem_claim ✔"
+}
+
+# ============================================================
+# TEST 16 — MGET diretto sui kvstore
+# Scopo:
+#   Verificare POST /kv/mget dei backend (usato dal front per
+#   raggruppare le letture): restituisce i valori LWW grezzi
+#   ({"_ts","data"}) delle sole chiavi presenti su quel nodo.
+#
+# Passi:
+#   1) Scrive una chiave via front (finisce su 2 backend su 3).
+#   2) MGET diretto su ogni backend con la chiave e una assente:
+#      la chiave compare solo dove GET /kv/{key} la trova,
+#      l'assente non compare mai.
+# ============================================================
+test_backend_mget(){
+  section "TEST 16: MGET diretto sui kvstore"
+
+  local key="delivery:test-bmget-1" kx="delivery:test-bmget-missing"
+  kv_put_obj "$key" '{"id":"test-bmget-1","status":"pending","weight":3.0}'
+
+  local base r single have=0
+  for base in "${KV_A}" "${KV_B}" "${KV_C}"; do
+    r="$(curl -sf -X POST -H "Content-Type: application/json" \
+         -d "{\"keys\":[\"$key\",\"$kx\"]}" "${base}/kv/mget")" || { red "FAIL: mget su ${base}"; return 1; }
+    single="$(backend_get_value "$base" "$key")"
+    log "${base} mget -> $(echo "$r" | ${JQ} -c '.values|keys')"
+    echo "$r" | ${JQ} -e --arg kx "$kx" '.values|has($kx)|not' >/dev/null || { red "FAIL: ${base} restituisce una chiave assente"; return 1; }
+    if [[ -n "$single" ]]; then
+      have=$((have+1))
+      echo "$r" | ${JQ} -e --arg k "$key" '.values[$k].data.id=="test-bmget-1" and .values[$k]._ts>0' >/dev/null \
+        || { red "FAIL: ${base} mget non coerente con GET"; return 1; }
+    else
+      echo "$r" | ${JQ} -e --arg k "$key" '.values|has($k)|not' >/dev/null || { red "FAIL: ${base} mget inventa la chiave"; return 1; }
+    fi
+  done
+  [[ $have -eq 2 ]] || { red "FAIL: atteso 2 repliche con la chiave (trovate $have)"; return 1; }
+  green "PASS: mget dei kvstore ✔"
+}
+
 # ---------------------------------------------------------
 # Main
 # ---------------------------------------------------------
@@ -598,6 +855,13 @@ main(){
   #test_consistent_hashing_stability
   #test_cache_lru_smoke
   test_backend_restart_resilience
+  test_mget_versions
+  test_mput_mcas
+  test_patch_cas
+  test_mpatch
+  test_txn_compensation
+  test_idem_claim
+  test_backend_mget
 
   green "Tutti i test KV completati ✔"
 }